@@ -2,35 +2,34 @@
 
 import logging
 from typing import Optional, AsyncIterator
-import subprocess
-import json
+import uuid
 import httpx
+import orjson
 from google.adk.agents import BaseAgent
 from google.adk.events import Event
 from google.genai import types as genai_types
-from pathlib import Path
-from datetime import datetime
 
-logger = logging.getLogger(__name__)
+from .agent_engine_http import (
+    AgentEngineConnection,
+    agent_engine_logger,
+    aiter_lines,
+    ensure_raw_logger,
+)
 
-# Create separate logger for raw Agent Engine responses
-agent_engine_logger = logging.getLogger("agent_engine_raw")
-agent_engine_logger.setLevel(logging.DEBUG)
+logger = logging.getLogger(__name__)
 
-# Create agent_engine_raw logs directory and file
-logs_dir = Path(__file__).parent.parent / "logs"
-logs_dir.mkdir(exist_ok=True)
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-agent_engine_log_file = logs_dir / f"agent_engine_raw_{timestamp}.log"
+# Builds a genai Part from the first recognized field of a GCP part dict.
+# function_call / function_response parts show up as tool calls / results in dojo.
+_PART_BUILDERS = {
+    'text': lambda value: genai_types.Part(text=value),
+    'function_call': lambda value: genai_types.Part(function_call=value),
+    'function_response': lambda value: genai_types.Part(function_response=value),
+}
 
-# File handler for Agent Engine raw responses only
-agent_engine_handler = logging.FileHandler(agent_engine_log_file, encoding='utf-8')
-agent_engine_handler.setLevel(logging.DEBUG)
-agent_engine_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
-agent_engine_logger.addHandler(agent_engine_handler)
-agent_engine_logger.propagate = False  # Don't propagate to root logger
 
-logger.info(f"📝 Agent Engine raw responses will be saved to: {agent_engine_log_file}")
+def _join_part_texts(parts) -> str:
+    """Join the text of message parts; parts without text (e.g. images) are skipped."""
+    return " ".join(part.text for part in parts if getattr(part, 'text', None))
 
 
 class ReasoningEngineAgent(BaseAgent):
@@ -57,6 +56,8 @@ class ReasoningEngineAgent(BaseAgent):
         """
         super().__init__(name=f"reasoning_engine_{reasoning_engine_id}")
         
+        ensure_raw_logger()
+        
         # Store configuration in a dict to avoid Pydantic field issues
         self._config = {
             'project_id': project_id,
@@ -64,6 +65,10 @@ class ReasoningEngineAgent(BaseAgent):
             'reasoning_engine_id': reasoning_engine_id,
         }
         
+        # Fallback user_id reused across calls so the Reasoning Engine can keep
+        # per-user state when the invocation context doesn't carry one
+        self._user_id = str(uuid.uuid4())
+        
         # Build the endpoint URL - use streamQuery with SSE
         agent_resource_name = (
             f"projects/{project_id}/locations/{location}/"
@@ -78,20 +83,25 @@ class ReasoningEngineAgent(BaseAgent):
             f"in project {project_id} at {location}"
         )
         logger.info(f"Endpoint: {self._endpoint_url}")
+        
+        # Request body template; only the 'input' values change per call
+        self._payload_template = {
+            "class_method": "async_stream_query",
+            "input": {"message": "", "user_id": ""},
+        }
+        
+        # Pooled HTTP client and cached access token for the endpoint
+        self._connection = AgentEngineConnection()
     
-    def _get_auth_token(self) -> str:
-        """Get Google Cloud access token using gcloud."""
-        try:
-            result = subprocess.run(
-                ["gcloud", "auth", "print-access-token"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            return result.stdout.strip()
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Failed to get access token. Make sure you're logged in with 'gcloud auth login'. Error: {e}")
-            raise RuntimeError("Failed to get access token. Please run: gcloud auth login")
+    async def close(self) -> None:
+        """Close the shared HTTP client and release pooled connections."""
+        await self._connection.close()
+    
+    async def __aenter__(self) -> "ReasoningEngineAgent":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
     
     async def _run_async_impl(
         self,
@@ -112,215 +122,169 @@ class ReasoningEngineAgent(BaseAgent):
         Yields:
             Event: ADK events from the Reasoning Engine
         """
-        # Debug logging
-        logger.info(f"_run_async_impl called with:")
-        logger.info(f"  instruction: {instruction}")
-        logger.info(f"  messages type: {type(messages)}")
-        logger.info(f"  messages length: {len(messages) if messages else 0}")
-        logger.info(f"  kwargs keys: {list(kwargs.keys())}")
-        logger.info(f"  kwargs: {kwargs}")
-        if messages:
-            for i, msg in enumerate(messages):
-                logger.info(f"  message[{i}]: type={type(msg)}, value={msg}")
-                if hasattr(msg, '__dict__'):
-                    logger.info(f"  message[{i}] attributes: {msg.__dict__}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "_run_async_impl called with instruction=%s, %d messages, kwargs=%s",
+                instruction, len(messages) if messages else 0, kwargs,
+            )
+            for i, msg in enumerate(messages or ()):
+                logger.debug("  message[%d]: type=%s, value=%s", i, type(msg), msg)
         
         # Build the request payload
         # Extract the user message from the instruction (RunContext)
         # ADK Runner passes a RunContext object as 'instruction' with user_content
         user_message = ""
         
-        if instruction and hasattr(instruction, 'user_content'):
+        user_content = getattr(instruction, 'user_content', None)
+        if user_content is not None:
             # Extract from user_content (Content object)
-            user_content = instruction.user_content
-            if hasattr(user_content, 'parts') and user_content.parts:
-                user_message = " ".join([
-                    part.text if hasattr(part, 'text') else str(part)
-                    for part in user_content.parts
-                ])
-        elif messages and len(messages) > 0:
+            parts = getattr(user_content, 'parts', None)
+            if parts:
+                user_message = _join_part_texts(parts)
+        elif messages:
             # Fallback: try to extract from messages if provided
             last_msg = messages[-1]
-            if hasattr(last_msg, 'parts') and last_msg.parts:
-                user_message = " ".join([
-                    part.text if hasattr(part, 'text') else str(part)
-                    for part in last_msg.parts
-                ])
-            elif hasattr(last_msg, 'content'):
-                if isinstance(last_msg.content, str):
-                    user_message = last_msg.content
-                elif hasattr(last_msg.content, 'parts'):
-                    user_message = " ".join([
-                        part.text if hasattr(part, 'text') else str(part)
-                        for part in last_msg.content.parts
-                    ])
+            parts = getattr(last_msg, 'parts', None)
+            content = getattr(last_msg, 'content', None)
+            if parts:
+                user_message = _join_part_texts(parts)
+            elif isinstance(content, str):
+                user_message = content
+            else:
+                content_parts = getattr(content, 'parts', None)
+                if content_parts:
+                    user_message = _join_part_texts(content_parts)
         
-        logger.info(f"Extracted user message: {user_message}")
+        logger.debug("Extracted user message: %s", user_message)
         
         # Use the working format from the reference implementation
-        # Generate a user_id (you can make this more sophisticated)
-        import uuid
-        user_id = str(uuid.uuid4())
+        # Prefer the ADK invocation's user_id, else the agent-scoped fallback
+        user_id = getattr(instruction, 'user_id', None) or self._user_id
         
-        payload = {
-            "class_method": "async_stream_query",
-            "input": {
-                "message": user_message,
-                "user_id": user_id
-            }
-        }
+        headers = await self._connection.auth_headers()
         
-        headers = {
-            "Authorization": f"Bearer {self._get_auth_token()}",
-            "Content-Type": "application/json",
-        }
+        # Fill the reused payload template and serialize it before the next
+        # await, so concurrent runs never see each other's message
+        payload_input = self._payload_template["input"]
+        payload_input["message"] = user_message
+        payload_input["user_id"] = user_id
+        payload_json = orjson.dumps(self._payload_template)
         
-        logger.info(f"Calling Reasoning Engine with message: {user_message[:100]}...")
-        logger.info(f"Payload: {payload}")
+        logger.info("Calling Reasoning Engine with message: %.100s...", user_message)
         
         # Log request to Agent Engine raw log
-        agent_engine_logger.info("=" * 80)
-        agent_engine_logger.info("REQUEST TO AGENT ENGINE:")
-        agent_engine_logger.info(f"User Message: {user_message}")
-        agent_engine_logger.info(f"Payload: {json.dumps(payload, indent=2)}")
-        agent_engine_logger.info("=" * 80)
+        if agent_engine_logger.isEnabledFor(logging.DEBUG):
+            agent_engine_logger.debug(
+                "REQUEST TO AGENT ENGINE:\nUser Message: %s\nPayload: %s",
+                user_message,
+                payload_json.decode(),
+            )
         
         try:
             # Use streaming endpoint
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                async with client.stream(
-                    "POST",
-                    self._endpoint_url,
-                    json=payload,
-                    headers=headers,
-                ) as response:
+            client = self._connection.http_client()
+            async with client.stream(
+                "POST",
+                self._endpoint_url,
+                content=payload_json,
+                headers=headers,
+            ) as response:
+                
+                if response.status_code != 200:
+                    error_text = await response.aread()
+                    error_msg = f"HTTP {response.status_code}: {error_text.decode('utf-8')}"
+                    logger.error(error_msg)
+                    agent_engine_logger.error(f"ERROR: {error_msg}")
                     
-                    if response.status_code != 200:
-                        error_text = await response.aread()
-                        error_msg = f"HTTP {response.status_code}: {error_text.decode('utf-8')}"
-                        logger.error(error_msg)
-                        agent_engine_logger.error(f"ERROR: {error_msg}")
+                    # Yield error event
+                    yield Event(
+                        author="model",
+                        content=genai_types.Content(
+                            role="model",
+                            parts=[genai_types.Part(text=f"Error: {error_msg}")]
+                        )
+                    )
+                    return
+                
+                # Process streaming response line by line
+                # Accumulate text and yield as complete events
+                async for line in aiter_lines(response):
+                    try:
+                        # Parse JSON response (GCP returns JSON directly, not SSE format)
+                        data = orjson.loads(line)
                         
-                        # Yield error event
-                        from google.adk.events import Event
-                        yield Event(
-                            author="model",
-                            content=genai_types.Content(
-                                role="model",
-                                parts=[genai_types.Part(text=f"Error: {error_msg}")]
+                        # Log the raw event line as received instead of re-serializing it
+                        if agent_engine_logger.isEnabledFor(logging.DEBUG):
+                            agent_engine_logger.debug(
+                                "RAW AGENT ENGINE RESPONSE:\n%s", line.decode("utf-8", "replace")
                             )
-                        )
-                        return
-                    
-                    # Process streaming response line by line
-                    # Accumulate text and yield as complete events
-                    async for line in response.aiter_lines():
-                        line = line.strip()
                         
-                        if not line:
+                        # Log event details for debugging
+                        if isinstance(data, dict) and logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("📦 GCP Event - Keys: %s", list(data))
+                            if 'author' in data:
+                                logger.debug("   Author: %s", data['author'])
+                            content_data = data.get('content')
+                            if isinstance(content_data, dict):
+                                for part in content_data.get('parts') or ():
+                                    if 'function_call' in part:
+                                        logger.debug("   🔧 Tool Call: %s", part['function_call'].get('name', 'unknown'))
+                                    elif 'function_response' in part:
+                                        logger.debug("   ✅ Tool Response: %s", part['function_response'].get('name', 'unknown'))
+                                    elif 'text' in part:
+                                        logger.debug("   💬 Text: %s", part['text'][:100])
+                        
+                        # Create ADK Event from the GCP response
+                        # The GCP response already has the right structure with 'content' and 'parts'
+                        content_data = data.get('content') if isinstance(data, dict) else None
+                        if not isinstance(content_data, dict) or not content_data.get('parts'):
+                            # Nothing to translate (e.g. usage-only or empty frames)
                             continue
                         
-                        try:
-                            # Parse JSON response (GCP returns JSON directly, not SSE format)
-                            data = json.loads(line)
-                            
-                            # Log the FULL raw event to separate file
-                            agent_engine_logger.info("=" * 80)
-                            agent_engine_logger.info("RAW AGENT ENGINE RESPONSE:")
-                            agent_engine_logger.info(json.dumps(data, indent=2))
-                            agent_engine_logger.info("=" * 80)
+                        # Convert to genai_types.Content (the middleware joins a frame's
+                        # text parts into one delta itself)
+                        parts = []
+                        for part_dict in content_data['parts']:
+                            # thought_signature and other metadata fields have no builder
+                            # and are skipped; the thinking text arrives in 'text'
+                            for key, value in part_dict.items():
+                                build_part = _PART_BUILDERS.get(key)
+                                if build_part is not None:
+                                    parts.append(build_part(value))
+                                    break
+                        
+                        if parts:
+                            # Create ADK Event with author field
+                            author = data.get('author', 'model')
                             
-                            # Log event details for debugging
-                            if isinstance(data, dict):
-                                logger.info(f"📦 GCP Event - Keys: {list(data.keys())}")
-                                if 'author' in data:
-                                    logger.info(f"   Author: {data['author']}")
-                                if 'content' in data:
-                                    content_data = data['content']
-                                    if isinstance(content_data, dict) and 'parts' in content_data:
-                                        for i, part in enumerate(content_data['parts']):
-                                            part_types = [k for k in part.keys() if k != 'text' or part.get('text')]
-                                            if 'function_call' in part:
-                                                logger.info(f"   🔧 Tool Call: {part['function_call'].get('name', 'unknown')}")
-                                            elif 'function_response' in part:
-                                                logger.info(f"   ✅ Tool Response: {part['function_response'].get('name', 'unknown')}")
-                                            elif 'text' in part:
-                                                text_preview = part['text'][:100] if len(part['text']) > 100 else part['text']
-                                                logger.info(f"   💬 Text: {text_preview}")
+                            # Create the event - ADK middleware will translate it to AG-UI protocol
+                            event = Event(
+                                author=author,
+                                content=genai_types.Content(
+                                    role=content_data.get('role', 'model'),
+                                    parts=parts
+                                )
+                            )
                             
-                            # Create ADK Event from the GCP response
-                            # The GCP response already has the right structure with 'content' and 'parts'
-                            if isinstance(data, dict) and 'content' in data:
-                                content_data = data['content']
-                                
-                                # Convert to genai_types.Content
-                                parts = []
-                                if isinstance(content_data, dict) and 'parts' in content_data:
-                                    for part_dict in content_data['parts']:
-                                        # Check for thinking/reasoning content (thought_signature)
-                                        if 'thought_signature' in part_dict:
-                                            logger.info(f"   🧠 Thinking/reasoning detected (thought_signature present)")
-                                            # Note: thought_signature is typically a base64-encoded or encrypted representation
-                                            # The actual thinking text should be in the 'text' field of the same part
-                                        
-                                        if 'text' in part_dict:
-                                            parts.append(genai_types.Part(text=part_dict['text']))
-                                        elif 'function_call' in part_dict:
-                                            # Handle function calls - these show as tool calls in dojo
-                                            logger.info(f"   🔧 Creating Part with function_call: {part_dict['function_call']}")
-                                            parts.append(genai_types.Part(function_call=part_dict['function_call']))
-                                        elif 'function_response' in part_dict:
-                                            # Handle function responses - these show as tool results in dojo
-                                            logger.info(f"   ✅ Creating Part with function_response: {part_dict['function_response']}")
-                                            parts.append(genai_types.Part(function_response=part_dict['function_response']))
-                                
-                                if parts:
-                                    # Create ADK Event with author field
-                                    from google.adk.events import Event
-                                    author = data.get('author', 'model')
-                                    
-                                    # Create the event - ADK middleware will translate it to AG-UI protocol
-                                    event = Event(
-                                        author=author,
-                                        content=genai_types.Content(
-                                            role=content_data.get('role', 'model'),
-                                            parts=parts
-                                        )
-                                    )
-                                    
-                                    # Check if the Event has the expected helper methods
-                                    logger.info(f"   🔍 Event methods: {[m for m in dir(event) if 'function' in m.lower()]}")
-                                    if hasattr(event, 'get_function_calls'):
-                                        calls = event.get_function_calls()
-                                        logger.info(f"   📞 get_function_calls() returned: {len(calls) if calls else 0} calls")
-                                        if calls:
-                                            logger.info(f"   📞 Function calls details: {[{'id': fc.id, 'name': fc.name} for fc in calls]}")
-                                    if hasattr(event, 'get_function_responses'):
-                                        responses = event.get_function_responses()
-                                        logger.info(f"   📞 get_function_responses() returned: {len(responses) if responses else 0} responses")
-                                        if responses:
-                                            logger.info(f"   📞 Function responses details: {[{'id': fr.id, 'name': fr.name} for fr in responses]}")
-                                    
-                                    logger.debug(f"   ✅ Yielding ADK Event with {len(parts)} parts")
-                                    yield event
-                        
-                        except json.JSONDecodeError as e:
-                            logger.warning(f"Failed to parse JSON line: {e}")
-                            continue
-                        except Exception as e:
-                            logger.error(f"Error processing event: {e}", exc_info=True)
-                            agent_engine_logger.error(f"ERROR processing event: {e}")
-                            continue
+                            logger.debug("   ✅ Yielding ADK Event with %d parts", len(parts))
+                            yield event
                     
-                    logger.info(f"✅ Stream completed from Reasoning Engine")
-                    agent_engine_logger.info("✅ STREAM COMPLETED FROM AGENT ENGINE")
+                    except orjson.JSONDecodeError as e:
+                        logger.warning(f"Failed to parse JSON line: {e}")
+                        continue
+                    except Exception as e:
+                        logger.error(f"Error processing event: {e}", exc_info=True)
+                        agent_engine_logger.error(f"ERROR processing event: {e}")
+                        continue
                 
+                logger.info(f"✅ Stream completed from Reasoning Engine")
+                agent_engine_logger.info("✅ STREAM COMPLETED FROM AGENT ENGINE")
+            
         except httpx.HTTPStatusError as e:
             error_msg = f"HTTP {e.response.status_code} error: {e.response.text}"
             logger.error(error_msg)
             agent_engine_logger.error(f"HTTP ERROR: {error_msg}")
             # Yield an error response
-            from google.adk.events import Event
             yield Event(
                 author="model",
                 content=genai_types.Content(
@@ -331,7 +295,6 @@ class ReasoningEngineAgent(BaseAgent):
         except Exception as e:
             logger.error(f"Error calling Reasoning Engine: {e}", exc_info=True)
             agent_engine_logger.error(f"EXCEPTION: {e}")
-            from google.adk.events import Event
             yield Event(
                 author="model",
                 content=genai_types.Content(
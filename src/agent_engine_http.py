@@ -0,0 +1,194 @@
+"""
+HTTP plumbing shared by the Agent Engine clients.
+Pooled HTTP/2 connections, cached Google Cloud access tokens, stream line
+parsing and the raw Agent Engine traffic log.
+"""
+import asyncio
+import atexit
+import functools
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+import time
+import httpx
+import google.auth
+import google.auth.transport.requests
+from google.auth.exceptions import DefaultCredentialsError, RefreshError
+from typing import Optional, AsyncIterator, Dict
+from pathlib import Path
+from datetime import datetime
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 connection pool shared by every Reasoning Engine call on a client instance
+HTTP_TIMEOUT_SECONDS = 60.0
+HTTP_LIMITS = httpx.Limits(max_connections=1000, max_keepalive_connections=100)
+
+# OAuth scope required by the Vertex AI Reasoning Engine API
+CLOUD_PLATFORM_SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+# gcloud doesn't report token expiry, so fallback tokens are reused for a
+# conservative window well inside their one-hour lifetime
+GCLOUD_TOKEN_TTL_SECONDS = 300
+
+# Dedicated logger for raw Agent Engine communication
+agent_engine_logger = logging.getLogger("agent_engine_raw")
+
+
+@functools.lru_cache(maxsize=1)
+def ensure_raw_logger() -> None:
+    """Attach the raw Agent Engine log file on first use rather than at import time."""
+    # Full request/response bodies are logged at DEBUG, so only in development
+    agent_engine_logger.setLevel(logging.DEBUG if get_settings().debug else logging.INFO)
+    
+    logs_dir = Path(__file__).parent.parent / "logs"
+    logs_dir.mkdir(exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    agent_engine_log_file = logs_dir / f"agent_engine_raw_{timestamp}.log"
+    
+    # File handler for Agent Engine raw traffic only
+    agent_engine_handler = logging.FileHandler(agent_engine_log_file, encoding='utf-8')
+    agent_engine_handler.setLevel(logging.DEBUG)
+    agent_engine_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    
+    # Disk writes happen on the listener thread; the event loop only enqueues records
+    agent_engine_log_queue = queue.SimpleQueue()
+    agent_engine_logger.addHandler(QueueHandler(agent_engine_log_queue))
+    agent_engine_listener = QueueListener(agent_engine_log_queue, agent_engine_handler, respect_handler_level=True)
+    agent_engine_listener.start()
+    atexit.register(agent_engine_listener.stop)
+    agent_engine_logger.propagate = False  # Don't propagate to root logger
+    
+    logger.info(f"📝 Agent Engine raw responses will be saved to: {agent_engine_log_file}")
+
+
+async def aiter_lines(response: httpx.Response) -> AsyncIterator[bytes]:
+    """
+    Yield non-empty lines of a streaming response as raw bytes (no str decode).
+    
+    Only newly received bytes are scanned for newlines and consumed lines are
+    dropped once per chunk, so a line spanning many chunks is assembled in
+    linear time instead of being rescanned and recopied on every chunk.
+    """
+    buffer = bytearray()
+    scan_from = 0
+    async for chunk in response.aiter_bytes():
+        buffer.extend(chunk)
+        start = 0
+        with memoryview(buffer) as view:
+            while (newline := buffer.find(b"\n", scan_from)) != -1:
+                line = bytes(view[start:newline]).strip()
+                start = scan_from = newline + 1
+                if line:
+                    yield line
+        if start:
+            del buffer[:start]
+        scan_from = len(buffer)
+    
+    line = bytes(buffer).strip()
+    if line:
+        yield line
+
+
+class AgentEngineConnection:
+    """Pooled HTTP client and request headers for calls to a Reasoning Engine endpoint."""
+    
+    def __init__(self):
+        # Created lazily so it binds to the running event loop
+        self._http_client: Optional[httpx.AsyncClient] = None
+        
+        # Application Default Credentials cache their token until it expires;
+        # fall back to the gcloud CLI when ADC is not configured
+        try:
+            self._credentials, _ = google.auth.default(scopes=CLOUD_PLATFORM_SCOPES)
+        except DefaultCredentialsError as e:
+            logger.warning(f"Application Default Credentials not found, falling back to gcloud CLI: {e}")
+            self._credentials = None
+        
+        # Cached gcloud fallback token and its monotonic deadline
+        self._gcloud_token: Optional[str] = None
+        self._gcloud_token_expiry = 0.0
+        
+        # Request headers, rebuilt only when the access token changes
+        self._headers_token: Optional[str] = None
+        self._headers: Dict[str, str] = {}
+        
+        # Serializes token refreshes so concurrent requests share one refresh
+        self._refresh_lock = asyncio.Lock()
+    
+    def http_client(self) -> httpx.AsyncClient:
+        """Get the shared HTTP client, creating it on first use."""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(
+                timeout=HTTP_TIMEOUT_SECONDS,
+                limits=HTTP_LIMITS,
+                http2=True,
+            )
+        return self._http_client
+    
+    async def close(self) -> None:
+        """Close the shared HTTP client and release pooled connections."""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+    
+    async def auth_headers(self) -> Dict[str, str]:
+        """Get request headers, rebuilding them only when the access token changes."""
+        token = await self._get_auth_token()
+        if token != self._headers_token:
+            self._headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json",
+            }
+            self._headers_token = token
+        return self._headers
+    
+    async def _get_auth_token(self) -> str:
+        """Get Google Cloud access token, refreshing cached credentials only when expired."""
+        if self._credentials is None:
+            return await self._get_gcloud_token()
+        
+        if not self._credentials.valid:
+            async with self._refresh_lock:
+                # Another request may have refreshed the token while this one waited
+                if not self._credentials.valid:
+                    try:
+                        await asyncio.to_thread(
+                            self._credentials.refresh,
+                            google.auth.transport.requests.Request(),
+                        )
+                    except RefreshError as e:
+                        logger.error(f"Failed to refresh access token: {e}")
+                        raise RuntimeError("Failed to refresh access token. Please run: gcloud auth application-default login")
+        return self._credentials.token
+    
+    async def _get_gcloud_token(self) -> str:
+        """Get Google Cloud access token using gcloud, without blocking the event loop."""
+        if self._gcloud_token and time.monotonic() < self._gcloud_token_expiry:
+            return self._gcloud_token
+        
+        # Only needed when ADC is unavailable, so imported on demand
+        import subprocess
+        
+        async with self._refresh_lock:
+            # Another request may have fetched a token while this one waited
+            if self._gcloud_token and time.monotonic() < self._gcloud_token_expiry:
+                return self._gcloud_token
+            
+            try:
+                result = await asyncio.to_thread(
+                    subprocess.run,
+                    ["gcloud", "auth", "print-access-token"],
+                    capture_output=True,
+                    text=True,
+                    check=True
+                )
+            except subprocess.CalledProcessError as e:
+                logger.error(f"Failed to get access token. Make sure you're logged in with 'gcloud auth login'. Error: {e}")
+                raise RuntimeError("Failed to get access token. Please run: gcloud auth login")
+            
+            self._gcloud_token = result.stdout.strip()
+            self._gcloud_token_expiry = time.monotonic() + GCLOUD_TOKEN_TTL_SECONDS
+            return self._gcloud_token
@@ -3,33 +3,18 @@ Direct streaming client for Google Agent Engine.
 Returns raw JSON events without ADK translation.
 """
 import logging
-import subprocess
-import json
 import httpx
+import orjson
 from typing import Optional, AsyncIterator, Dict, Any
-from pathlib import Path
-from datetime import datetime
 
-logger = logging.getLogger(__name__)
-
-# Dedicated logger for raw Agent Engine communication
-agent_engine_logger = logging.getLogger("agent_engine_raw")
-
-# Configure the raw Agent Engine logger to write to a separate file
-logs_dir = Path(__file__).parent.parent / "logs"
-logs_dir.mkdir(exist_ok=True)
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-agent_engine_raw_log_file = logs_dir / f"agent_engine_raw_{timestamp}.log"
+from .agent_engine_http import (
+    AgentEngineConnection,
+    agent_engine_logger,
+    aiter_lines,
+    ensure_raw_logger,
+)
 
-# Ensure the raw logger is configured only once
-if not agent_engine_logger.handlers:
-    raw_file_handler = logging.FileHandler(agent_engine_raw_log_file, encoding='utf-8')
-    raw_file_handler.setLevel(logging.DEBUG)
-    raw_file_handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
-    agent_engine_logger.addHandler(raw_file_handler)
-    agent_engine_logger.propagate = False  # Prevent events from being passed to root logger
-    agent_engine_logger.setLevel(logging.DEBUG)
-    logger.info(f"📝 Raw Agent Engine logs will be saved to: {agent_engine_raw_log_file}")
+logger = logging.getLogger(__name__)
 
 
 class AgentEngineStreamClient:
@@ -53,6 +38,8 @@ class AgentEngineStreamClient:
         self.location = location
         self.agent_id = agent_id
         
+        ensure_raw_logger()
+        
         # Build the endpoint URL
         agent_resource_name = (
             f"projects/{project_id}/locations/{location}/"
@@ -67,22 +54,25 @@ class AgentEngineStreamClient:
             f"in project {project_id} at {location}"
         )
         logger.info(f"Endpoint: {self.endpoint_url}")
+        
+        # Request body template; only the 'input' values change per call
+        self._payload_template = {
+            "class_method": "async_stream_query",
+            "input": {"message": "", "user_id": ""},
+        }
+        
+        # Pooled HTTP client and cached access token for the endpoint
+        self._connection = AgentEngineConnection()
     
-    def _get_auth_token(self) -> str:
-        """Get Google Cloud access token using gcloud."""
-        try:
-            result = subprocess.run(
-                ["gcloud", "auth", "print-access-token"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            return result.stdout.strip()
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Failed to get access token: {e}")
-            raise RuntimeError(
-                "Failed to get access token. Please run: gcloud auth application-default login"
-            )
+    async def close(self) -> None:
+        """Close the shared HTTP client and release pooled connections."""
+        await self._connection.close()
+    
+    async def __aenter__(self) -> "AgentEngineStreamClient":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
     
     async def stream_query(
         self,
@@ -99,83 +89,75 @@ class AgentEngineStreamClient:
         Yields:
             Raw Agent Engine JSON events
         """
-        # Get auth token
-        token = self._get_auth_token()
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-        }
+        headers = await self._connection.auth_headers()
         
-        # Build payload
-        payload = {
-            "class_method": "async_stream_query",
-            "input": {
-                "message": message,
-                "user_id": user_id or "default-user"
-            }
-        }
+        # Fill the reused payload template and serialize it before the next
+        # await, so concurrent streams never see each other's message; the
+        # same bytes are logged and sent
+        payload_input = self._payload_template["input"]
+        payload_input["message"] = message
+        payload_input["user_id"] = user_id or "default-user"
+        payload_json = orjson.dumps(self._payload_template)
         
         # Log the request
-        agent_engine_logger.info("=" * 80)
-        agent_engine_logger.info("REQUEST TO AGENT ENGINE:")
-        agent_engine_logger.info(f"User Message: {message}")
-        agent_engine_logger.info(f"Payload: {json.dumps(payload, indent=2)}")
-        agent_engine_logger.info("=" * 80)
+        if agent_engine_logger.isEnabledFor(logging.DEBUG):
+            agent_engine_logger.debug(
+                "REQUEST TO AGENT ENGINE:\nUser Message: %s\nPayload: %s",
+                message,
+                payload_json.decode(),
+            )
         
-        logger.info(f"📤 Sending query to Agent Engine: '{message[:100]}...'")
+        logger.info("📤 Sending query to Agent Engine: '%.100s...'", message)
         
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                async with client.stream(
-                    "POST",
-                    self.endpoint_url,
-                    json=payload,
-                    headers=headers,
-                ) as response:
-                    # Check for errors
-                    if response.status_code != 200:
-                        error_text = await response.aread()
-                        error_msg = f"HTTP {response.status_code}: {error_text.decode()}"
-                        agent_engine_logger.error(f"HTTP Error: {error_msg}")
-                        logger.error(error_msg)
-                        raise httpx.HTTPStatusError(
-                            message=error_msg,
-                            request=response.request,
-                            response=response
-                        )
-                    
-                    # Stream response lines
-                    async for line in response.aiter_lines():
-                        line = line.strip()
-                        if not line:
-                            continue
+            client = self._connection.http_client()
+            async with client.stream(
+                "POST",
+                self.endpoint_url,
+                content=payload_json,
+                headers=headers,
+            ) as response:
+                # Check for errors
+                if response.status_code != 200:
+                    error_text = await response.aread()
+                    error_msg = f"HTTP {response.status_code}: {error_text.decode()}"
+                    agent_engine_logger.error(f"HTTP Error: {error_msg}")
+                    logger.error(error_msg)
+                    raise httpx.HTTPStatusError(
+                        message=error_msg,
+                        request=response.request,
+                        response=response
+                    )
+                
+                # Stream response lines
+                async for line in aiter_lines(response):
+                    try:
+                        # Parse JSON straight from bytes
+                        data = orjson.loads(line)
+                        
+                        # Log the raw line as received instead of re-serializing it
+                        if agent_engine_logger.isEnabledFor(logging.DEBUG):
+                            agent_engine_logger.debug(
+                                "RAW AGENT ENGINE RESPONSE:\n%s", line.decode("utf-8", "replace")
+                            )
+                        
+                        # Yield the raw JSON event
+                        yield data
                         
-                        try:
-                            # Parse JSON
-                            data = json.loads(line)
-                            
-                            # Log the raw response
-                            agent_engine_logger.info("RAW AGENT ENGINE RESPONSE:")
-                            agent_engine_logger.info(json.dumps(data, indent=2))
-                            agent_engine_logger.info("-" * 40)
-                            
-                            # Yield the raw JSON event
-                            yield data
-                            
-                        except json.JSONDecodeError as e:
-                            agent_engine_logger.warning(f"Failed to parse JSON line: {e}")
-                            logger.warning(f"Failed to parse JSON line from Agent Engine: {e}")
-                            continue
-                        except Exception as e:
-                            agent_engine_logger.error(f"Error processing event: {e}", exc_info=True)
-                            logger.error(f"Error processing Agent Engine event: {e}", exc_info=True)
-                            continue
-                    
-                    agent_engine_logger.info("=" * 80)
-                    agent_engine_logger.info("✅ STREAM COMPLETED FROM AGENT ENGINE")
-                    agent_engine_logger.info("=" * 80)
-                    logger.info("✅ Stream completed from Agent Engine")
-                    
+                    except orjson.JSONDecodeError as e:
+                        agent_engine_logger.warning(f"Failed to parse JSON line: {e}")
+                        logger.warning(f"Failed to parse JSON line from Agent Engine: {e}")
+                        continue
+                    except Exception as e:
+                        agent_engine_logger.error(f"Error processing event: {e}", exc_info=True)
+                        logger.error(f"Error processing Agent Engine event: {e}", exc_info=True)
+                        continue
+                
+                agent_engine_logger.info("=" * 80)
+                agent_engine_logger.info("✅ STREAM COMPLETED FROM AGENT ENGINE")
+                agent_engine_logger.info("=" * 80)
+                logger.info("✅ Stream completed from Agent Engine")
+                
         except httpx.HTTPStatusError as e:
             error_msg = f"HTTP {e.response.status_code} error: {e.response.text}"
             agent_engine_logger.error(f"HTTP Error calling Agent Engine: {error_msg}")
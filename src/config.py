@@ -1,7 +1,8 @@
 """Configuration management for the bridge app."""
 
+from functools import lru_cache
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -19,6 +20,11 @@ class Settings(BaseSettings):
     # Server Configuration
     port: int = 8000
     host: str = "0.0.0.0"
+    # Production worker processes; ADK sessions are per process, so raise this
+    # (e.g. 2n+1 for n cores) only with sticky sessions
+    workers: int = 1
+    # Allowed CORS origins (JSON list in the environment); restrict this in production
+    cors_origins: List[str] = ["*"]
     
     # ADK Middleware Configuration
     app_name: str = "dojo_bridge"
@@ -26,6 +32,11 @@ class Settings(BaseSettings):
     execution_timeout_seconds: int = 600
     max_concurrent_executions: int = 10
     
+    # Metadata store: "memory" (single process) or "redis" (shared across workers)
+    metadata_backend: str = "memory"
+    redis_url: str = "redis://localhost:6379/0"
+    metadata_ttl_minutes: int = 60
+    
     # Environment
     environment: str = "development"
     
@@ -46,7 +57,8 @@ class Settings(BaseSettings):
         return not self.is_production
 
 
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
-    """Get application settings."""
+    """Get application settings (parsed once and cached)."""
     return Settings()
 
@@ -1,25 +1,27 @@
 """Main FastAPI application for the AG-UI Dojo to Agent Engine bridge."""
 
+import atexit
 import logging
+import queue
 import sys
+from contextlib import asynccontextmanager
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener, TimedRotatingFileHandler
 from pathlib import Path
-from datetime import datetime
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
-
-from ag_ui_adk import ADKAgent, add_adk_fastapi_endpoint
 
 from .config import get_settings
-from .agent_engine_client import create_agent_engine_client
+
+# Load settings
+settings = get_settings()
 
 # Create logs directory
 logs_dir = Path(__file__).parent.parent / "logs"
 logs_dir.mkdir(exist_ok=True)
 
-# Create timestamped log file
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-event_log_file = logs_dir / f"events_{timestamp}.log"
+# Single event log file, rotated at midnight (7 days kept)
+event_log_file = logs_dir / "events.log"
 
 # Configure logging with both console and file handlers
 log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -29,28 +31,151 @@ console_handler = logging.StreamHandler(sys.stdout)
 console_handler.setLevel(logging.INFO)
 console_handler.setFormatter(logging.Formatter(log_format))
 
-# File handler for detailed event logs
-file_handler = logging.FileHandler(event_log_file, encoding='utf-8')
+# File handler for detailed event logs (opened on first write)
+file_handler = TimedRotatingFileHandler(
+    event_log_file, when="midnight", backupCount=7, encoding='utf-8', delay=True
+)
 file_handler.setLevel(logging.DEBUG)
 file_handler.setFormatter(logging.Formatter(log_format))
 
-# Configure root logger
+# Outside development, buffer file writes and flush them in batches (immediately
+# on ERROR); in development records are written as they arrive so that
+# `tail -f logs/events.log` stays live
+if settings.debug:
+    file_log_handler = file_handler
+else:
+    file_log_handler = MemoryHandler(
+        capacity=512,
+        flushLevel=logging.ERROR,
+        target=file_handler,
+        flushOnClose=True,
+    )
+atexit.register(file_log_handler.flush)
+
+# Console and file writes happen on a listener thread; request handlers only enqueue records
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, console_handler, file_log_handler, respect_handler_level=True)
+log_listener.start()
+# Stopped only at exit (draining queued records), so logging keeps working across lifespans
+atexit.register(log_listener.stop)
+
+# Configure root logger (records are formatted by the listener's handlers)
 logging.basicConfig(
-    level=logging.DEBUG,
-    format=log_format,
-    handlers=[console_handler, file_handler],
+    level=logging.DEBUG if settings.debug else logging.INFO,
+    format="%(message)s",
+    handlers=[QueueHandler(log_queue)],
 )
 
-# Set specific loggers to DEBUG to see event translation
-logging.getLogger("ag_ui_adk.event_translator").setLevel(logging.DEBUG)
-logging.getLogger("ag_ui_adk.adk_agent").setLevel(logging.DEBUG)
-logging.getLogger("google_adk.google.adk.models.google_llm").setLevel(logging.DEBUG)
+# Set specific loggers to DEBUG to see event translation (development only)
+if settings.debug:
+    logging.getLogger("ag_ui_adk.event_translator").setLevel(logging.DEBUG)
+    logging.getLogger("ag_ui_adk.adk_agent").setLevel(logging.DEBUG)
+    logging.getLogger("google_adk.google.adk.models.google_llm").setLevel(logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 logger.info(f"📝 Event logs will be saved to: {event_log_file}")
 
-# Load settings
-settings = get_settings()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize the bridge on startup and release its resources on shutdown."""
+    app.state.agent_engine_agent = None
+    
+    logger.info("=" * 60)
+    logger.info("Starting AG-UI Dojo to Agent Engine Bridge")
+    logger.info("=" * 60)
+    logger.info(f"Environment: {settings.environment}")
+    logger.info(f"Project ID: {settings.gcp_project_id}")
+    logger.info(f"Location: {settings.gcp_location}")
+    logger.info(f"Agent ID: {settings.agent_engine_resource_id}")
+    logger.info(f"Port: {settings.port}")
+    logger.info("=" * 60)
+    
+    # Heavy imports are deferred so importing this module stays cheap
+    from ag_ui_adk import ADKAgent, add_adk_fastapi_endpoint
+    from .agent_engine_client import create_agent_engine_client
+    
+    # Initialize the Agent Engine connection and ADK middleware
+    try:
+        logger.info("Connecting to Agent Engine deployment...")
+        
+        # Create the agent client
+        agent_engine_agent = create_agent_engine_client(
+            project_id=settings.gcp_project_id,
+            location=settings.gcp_location,
+            agent_id=settings.agent_engine_resource_id,
+            credentials_path=settings.google_application_credentials,
+        )
+        
+        # Verify agent was created
+        if agent_engine_agent is None:
+            raise ValueError("Agent Engine client returned None - check configuration")
+        
+        logger.info(f"✅ Agent Engine client created: {type(agent_engine_agent)}")
+        
+        # Wrap with ADK middleware
+        bridge_agent = ADKAgent(
+            adk_agent=agent_engine_agent,
+            app_name=settings.app_name,
+            session_timeout_seconds=settings.session_timeout_seconds,
+            execution_timeout_seconds=settings.execution_timeout_seconds,
+            max_concurrent_executions=settings.max_concurrent_executions,
+            use_in_memory_services=True,  # Use in-memory for simplicity
+        )
+        
+        # Verify bridge agent was created
+        if bridge_agent is None:
+            raise ValueError("ADKAgent middleware returned None")
+        
+        logger.info(f"✅ ADK middleware created: {type(bridge_agent)}")
+        
+        # Add the endpoint
+        app.state.agent_engine_agent = agent_engine_agent
+        app.state.bridge_agent = bridge_agent
+        add_adk_fastapi_endpoint(app, bridge_agent, path="/chat")
+        
+        logger.info("✅ Agent Engine connection established successfully!")
+        logger.info("✅ ADK middleware endpoint added at /chat")
+        
+    except Exception as init_error:
+        error_message = str(init_error)
+        logger.error(f"❌ Failed to initialize Agent Engine connection: {error_message}")
+        logger.error("The /chat endpoint will not be available.")
+        logger.error("Please check your configuration and Agent Engine deployment.")
+        
+        # Add a placeholder endpoint that returns an SSE error event
+        from fastapi import Request
+        from fastapi.responses import StreamingResponse
+        from ag_ui.core import RunErrorEvent, EventType, RunAgentInput
+        from ag_ui.encoder import EventEncoder
+        
+        @app.post("/chat")
+        async def chat_error(input_data: RunAgentInput, request: Request):
+            """Return an SSE error event when Agent Engine is not configured."""
+            accept_header = request.headers.get("accept")
+            encoder = EventEncoder(accept=accept_header)
+            
+            async def error_generator():
+                # Create a proper AG-UI error event
+                error_event = RunErrorEvent(
+                    type=EventType.RUN_ERROR,
+                    message=f"Agent Engine connection not configured: {error_message}",
+                    code="AGENT_ENGINE_NOT_CONFIGURED"
+                )
+                yield encoder.encode(error_event)
+            
+            return StreamingResponse(error_generator(), media_type=encoder.get_content_type())
+    
+    yield
+    
+    logger.info("Shutting down bridge...")
+    # Release pooled Agent Engine connections
+    if app.state.agent_engine_agent is not None:
+        await app.state.agent_engine_agent.close()
+    
+    # Write out buffered log records
+    file_log_handler.flush()
+
 
 # Create FastAPI app
 app = FastAPI(
@@ -58,32 +183,21 @@ app = FastAPI(
     description="Bridge service to connect AG-UI Dojo to Google Agent Engine deployments",
     version="0.1.0",
     debug=settings.debug,
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # In production, specify your dojo domain
+    allow_origins=settings.cors_origins,  # In production, specify your dojo domain
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type", "Accept", "Authorization"],
+    max_age=86400,  # Let browsers cache preflight results for a day
 )
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize the bridge on startup."""
-    logger.info("=" * 60)
-    logger.info("Starting AG-UI Dojo to Agent Engine Bridge")
-    logger.info("=" * 60)
-    logger.info(f"Environment: {settings.environment}")
-    logger.info(f"Project ID: {settings.gcp_project_id}")
-    logger.info(f"Location: {settings.gcp_location}")
-    logger.info(f"Agent ID: {settings.agent_engine_resource_id}")
-    logger.info(f"Port: {settings.port}")
-    logger.info("=" * 60)
-
-
 @app.get("/")
 async def root():
     """Root endpoint with service information."""
@@ -110,95 +224,41 @@ async def health_check():
     return {"status": "healthy"}
 
 
-# Initialize the Agent Engine connection and ADK middleware
-try:
-    logger.info("Connecting to Agent Engine deployment...")
-    
-    # Create the agent client
-    agent_engine_agent = create_agent_engine_client(
-        project_id=settings.gcp_project_id,
-        location=settings.gcp_location,
-        agent_id=settings.agent_engine_resource_id,
-        credentials_path=settings.google_application_credentials,
-    )
-    
-    # Verify agent was created
-    if agent_engine_agent is None:
-        raise ValueError("Agent Engine client returned None - check configuration")
-    
-    logger.info(f"✅ Agent Engine client created: {type(agent_engine_agent)}")
-    
-    # Wrap with ADK middleware
-    bridge_agent = ADKAgent(
-        adk_agent=agent_engine_agent,
-        app_name=settings.app_name,
-        session_timeout_seconds=settings.session_timeout_seconds,
-        execution_timeout_seconds=settings.execution_timeout_seconds,
-        max_concurrent_executions=settings.max_concurrent_executions,
-        use_in_memory_services=True,  # Use in-memory for simplicity
-    )
-    
-    # Verify bridge agent was created
-    if bridge_agent is None:
-        raise ValueError("ADKAgent middleware returned None")
-    
-    logger.info(f"✅ ADK middleware created: {type(bridge_agent)}")
-    
-    # Add the endpoint
-    add_adk_fastapi_endpoint(app, bridge_agent, path="/chat")
-    
-    logger.info("✅ Agent Engine connection established successfully!")
-    logger.info("✅ ADK middleware endpoint added at /chat")
-    
-except Exception as init_error:
-    error_message = str(init_error)
-    logger.error(f"❌ Failed to initialize Agent Engine connection: {error_message}")
-    logger.error("The /chat endpoint will not be available.")
-    logger.error("Please check your configuration and Agent Engine deployment.")
-    
-    # Add a placeholder endpoint that returns an SSE error event
-    from fastapi import Request
-    from fastapi.responses import StreamingResponse
-    from ag_ui.core import RunErrorEvent, EventType, RunAgentInput
-    from ag_ui.encoder import EventEncoder
-    
-    @app.post("/chat")
-    async def chat_error(input_data: RunAgentInput, request: Request):
-        """Return an SSE error event when Agent Engine is not configured."""
-        accept_header = request.headers.get("accept")
-        encoder = EventEncoder(accept=accept_header)
-        
-        async def error_generator():
-            # Create a proper AG-UI error event
-            error_event = RunErrorEvent(
-                type=EventType.RUN_ERROR,
-                message=f"Agent Engine connection not configured: {error_message}",
-                code="AGENT_ENGINE_NOT_CONFIGURED"
-            )
-            yield encoder.encode(error_event)
-        
-        return StreamingResponse(error_generator(), media_type=encoder.get_content_type())
+# uvloop and httptools ship with uvicorn[standard]; uvloop is POSIX-only, so
+# Windows falls back to uvicorn's default asyncio loop
+UVICORN_LOOP = "auto" if sys.platform == "win32" else "uvloop"
+UVICORN_HTTP = "httptools"
 
 
 def run_dev():
     """Run the development server."""
+    import uvicorn
+    
     logger.info("Starting development server...")
     uvicorn.run(
         "src.main:app",
         host=settings.host,
         port=settings.port,
         reload=True,
+        loop=UVICORN_LOOP,
+        http=UVICORN_HTTP,
         log_level="debug" if settings.debug else "info",
     )
 
 
 def run_prod():
     """Run the production server."""
-    logger.info("Starting production server...")
+    import uvicorn
+    
+    logger.info(f"Starting production server with {settings.workers} workers...")
+    # Multiple workers need an import string so each process loads its own app
     uvicorn.run(
-        app,
+        "src.main:app",
         host=settings.host,
         port=settings.port,
+        workers=settings.workers,
+        loop=UVICORN_LOOP,
+        http=UVICORN_HTTP,
         log_level="info",
     )
 
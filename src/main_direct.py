@@ -3,16 +3,22 @@ AG-UI Dojo to Agent Engine Bridge - Direct Protocol Implementation
 Bypasses ag_ui_adk middleware to directly translate Agent Engine events to AG-UI Protocol.
 """
 import os
+import asyncio
+import atexit
+import gzip
 import logging
+import queue
+import sys
 import uuid
-from datetime import datetime
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener, TimedRotatingFileHandler
 from pathlib import Path
 from contextlib import asynccontextmanager
 
+import orjson
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List, Any, Optional
 
 from .agent_engine_stream import AgentEngineStreamClient
@@ -20,35 +26,79 @@ from .protocol_translator import AGUIProtocolTranslator
 from .config import get_settings
 from .metadata_store import metadata_store
 
+# Load settings
+settings = get_settings()
+
 # Setup logging
 logs_dir = Path(__file__).parent.parent / "logs"
 logs_dir.mkdir(exist_ok=True)
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-log_file = logs_dir / f"events_{timestamp}.log"
+# Single event log file, rotated at midnight (7 days kept)
+log_file = logs_dir / "events.log"
+
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler = TimedRotatingFileHandler(
+    log_file, when="midnight", backupCount=7, encoding='utf-8', delay=True
+)
+file_handler.setFormatter(log_formatter)
+console_handler = logging.StreamHandler()
+console_handler.setFormatter(log_formatter)
 
+# Outside development, buffer file writes and flush them in batches (immediately
+# on ERROR); in development records are written as they arrive so that
+# `tail -f logs/events.log` stays live
+if settings.debug:
+    file_log_handler = file_handler
+else:
+    file_log_handler = MemoryHandler(
+        capacity=512,
+        flushLevel=logging.ERROR,
+        target=file_handler,
+        flushOnClose=True,
+    )
+atexit.register(file_log_handler.flush)
+
+# File and console writes happen on a listener thread; request handlers only enqueue records
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, file_log_handler, console_handler, respect_handler_level=True)
+log_listener.start()
+# Stopped only at exit (draining queued records), so logging keeps working across lifespans
+atexit.register(log_listener.stop)
+
+# Records are formatted by the listener's handlers
 logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+    level=logging.DEBUG if settings.debug else logging.INFO,
+    format='%(message)s',
+    handlers=[QueueHandler(log_queue)],
 )
 
 logger = logging.getLogger(__name__)
 logger.info(f"📝 Event logs will be saved to: {log_file}")
 
-# Load settings
-settings = get_settings()
+# How often stale metadata threads are expired
+METADATA_CLEANUP_INTERVAL_SECONDS = 60
+
+# /metadata bodies at least this large are gzipped for clients that accept it
+METADATA_GZIP_MIN_SIZE = 1024
+
+# Pre-encoded SSE frames for the static /chat errors
+NOT_INITIALIZED_SSE = b'data: {"type":"RUN_ERROR","message":"Agent client not initialized","code":"NOT_INITIALIZED"}\n\n'
+NO_USER_MESSAGE_SSE = b'data: {"type":"RUN_ERROR","message":"No user message found","code":"INVALID_INPUT"}\n\n'
+
 
-# Global client
-agent_client: AgentEngineStreamClient = None
+async def periodic_metadata_cleanup():
+    """Expire stale metadata threads in the background."""
+    while True:
+        await asyncio.sleep(METADATA_CLEANUP_INTERVAL_SECONDS)
+        try:
+            await metadata_store.cleanup_old_threads()
+        except Exception as e:
+            logger.error(f"❌ Metadata cleanup failed: {e}", exc_info=True)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan events for the FastAPI app."""
-    global agent_client
+    app.state.agent_client = None
     
     logger.info("=" * 60)
     logger.info("Starting AG-UI Dojo to Agent Engine Bridge")
@@ -58,15 +108,17 @@ async def lifespan(app: FastAPI):
     # Initialize Agent Engine client
     try:
         logger.info("Connecting to Agent Engine deployment...")
-        agent_client = AgentEngineStreamClient(
+        app.state.agent_client = AgentEngineStreamClient(
             project_id=settings.gcp_project_id,
             location=settings.gcp_location,
             agent_id=settings.agent_engine_resource_id,
         )
+        app.add_api_route("/chat", chat, methods=["POST"])
         logger.info("✅ Agent Engine client created successfully!")
     except Exception as e:
         logger.error(f"❌ Failed to initialize Agent Engine client: {e}")
-        raise
+        logger.error("The /chat endpoint will only return RUN_ERROR events.")
+        app.add_api_route("/chat", chat_not_initialized, methods=["POST"])
     
     logger.info("=" * 60)
     logger.info(f"Environment: {settings.environment}")
@@ -76,9 +128,22 @@ async def lifespan(app: FastAPI):
     logger.info(f"Port: {settings.port}")
     logger.info("=" * 60)
     
+    cleanup_task = asyncio.create_task(periodic_metadata_cleanup())
+    
     yield
     
     logger.info("Shutting down bridge...")
+    cleanup_task.cancel()
+    try:
+        await cleanup_task
+    except asyncio.CancelledError:
+        pass
+    if app.state.agent_client is not None:
+        await app.state.agent_client.close()
+    await metadata_store.close()
+    
+    # Write out buffered log records
+    file_log_handler.flush()
 
 
 # Create FastAPI app with direct protocol implementation
@@ -86,16 +151,18 @@ app = FastAPI(
     title=settings.app_name,
     description="AG-UI Protocol bridge to Google Agent Engine (Direct Implementation)",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=settings.cors_origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type", "Accept", "Authorization"],
+    max_age=86400,  # Let browsers cache preflight results for a day
 )
 
 
@@ -109,8 +176,7 @@ class Message(BaseModel):
     tool_call_id: Optional[str] = None
     tool_calls: Optional[List[Any]] = None
 
-    class Config:
-        extra = "allow"
+    model_config = ConfigDict(extra="allow", defer_build=True)
 
 
 class RunAgentInput(BaseModel):
@@ -124,12 +190,23 @@ class RunAgentInput(BaseModel):
     context: Optional[List[Any]] = None
     forwarded_props: Optional[Any] = None
 
-    class Config:
-        extra = "allow"
+    model_config = ConfigDict(extra="allow", defer_build=True)
+
+
+def _extract_text(content: Any) -> str:
+    """Get the text of a message's content (plain string or first multimodal text part)."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return next(
+            (part.get("text", "") for part in content if isinstance(part, dict) and part.get("type") == "text"),
+            ""
+        )
+    return ""
 
 
-@app.post("/chat")
-async def chat(input_data: RunAgentInput):
+# /chat is registered in lifespan: chat when the client starts, chat_not_initialized otherwise
+async def chat(input_data: RunAgentInput, request: Request):
     """
     Chat endpoint that streams AG-UI Protocol events.
     
@@ -139,39 +216,22 @@ async def chat(input_data: RunAgentInput):
     3. Translates them to AG-UI Protocol
     4. Returns as Server-Sent Events (SSE)
     """
-    global agent_client
-    
-    if agent_client is None:
-        logger.error("Agent client not initialized")
-        return StreamingResponse(
-            iter([f"data: {{\"type\":\"RUN_ERROR\",\"message\":\"Agent client not initialized\",\"code\":\"NOT_INITIALIZED\"}}\n\n"]),
-            media_type="text/event-stream"
-        )
+    agent_client = request.app.state.agent_client
     
-    # Extract user message from messages
-    user_message = ""
-    for msg in input_data.messages:
-        if msg.role == "user":
-            if isinstance(msg.content, str):
-                user_message = msg.content
-            elif isinstance(msg.content, list):
-                # Handle multimodal content
-                for part in msg.content:
-                    if isinstance(part, dict) and part.get("type") == "text":
-                        user_message = part.get("text", "")
-                        break
-            break
+    # Use the latest user message; earlier turns are already in the Agent Engine session
+    msg = next((m for m in reversed(input_data.messages) if m.role == "user"), None)
+    user_message = _extract_text(msg.content) if msg else ""
     
     if not user_message:
         logger.error("No user message found in request")
         return StreamingResponse(
-            iter([f"data: {{\"type\":\"RUN_ERROR\",\"message\":\"No user message found\",\"code\":\"INVALID_INPUT\"}}\n\n"]),
+            iter([NO_USER_MESSAGE_SSE]),
             media_type="text/event-stream"
         )
     
     # Generate IDs
-    thread_id = input_data.thread_id or str(uuid.uuid4())
-    run_id = input_data.run_id or str(uuid.uuid4())
+    thread_id = input_data.thread_id or uuid.uuid4().hex
+    run_id = input_data.run_id or uuid.uuid4().hex
     user_id = "default-user"  # Can be extracted from context if needed
     
     logger.info(f"📨 Received chat request")
@@ -192,19 +252,23 @@ async def chat(input_data: RunAgentInput):
             # Create protocol translator with metadata storage
             translator = AGUIProtocolTranslator(metadata_store=metadata_store)
             
-            # Translate and stream events
+            # Translate and stream events; the translator yields UTF-8 SSE chunks
+            # that StreamingResponse writes as-is, with no per-chunk str.encode
+            debug_enabled = logger.isEnabledFor(logging.DEBUG)
             async for agui_event in translator.translate_stream(
                 agent_stream,
                 thread_id=thread_id,
                 run_id=run_id
             ):
-                logger.debug(f"📤 Streaming AG-UI event: {agui_event[:100]}...")
+                if debug_enabled:
+                    logger.debug("📤 Streaming AG-UI event: %s...", agui_event[:100].decode(errors="replace"))
                 yield agui_event
                 
         except Exception as e:
             logger.error(f"❌ Error in event stream: {e}", exc_info=True)
-            error_event = f'data: {{"type":"RUN_ERROR","message":"{str(e)}","code":"STREAM_ERROR"}}\n\n'
-            yield error_event
+            # orjson escapes quotes/newlines in the message so the frame stays valid JSON
+            error_payload = orjson.dumps({"type": "RUN_ERROR", "message": str(e), "code": "STREAM_ERROR"})
+            yield b"data: " + error_payload + b"\n\n"
     
     return StreamingResponse(
         event_generator(),
@@ -217,26 +281,52 @@ async def chat(input_data: RunAgentInput):
     )
 
 
+async def chat_not_initialized():
+    """Return an SSE error event when the Agent Engine client failed to start."""
+    logger.error("Agent client not initialized")
+    return StreamingResponse(
+        iter([NOT_INITIALIZED_SSE]),
+        media_type="text/event-stream"
+    )
+
+
 @app.get("/metadata/{thread_id}")
-async def get_metadata(thread_id: str):
+async def get_metadata(thread_id: str, request: Request):
     """
     Get metadata (thinking events, session stats) for a specific thread.
     This endpoint provides CUSTOM events that CopilotKit filters out.
+    
+    Responses carry an ETag derived from lastUpdated, so pollers that send
+    If-None-Match get a bodiless 304 while the thread is unchanged.
     """
     logger.debug(f"Metadata requested for thread: {thread_id}")
-    metadata = metadata_store.get_metadata(thread_id)
+    metadata = await metadata_store.get_metadata(thread_id)
+    
+    if metadata["lastUpdated"] is None:
+        return metadata
+    
+    etag = f'W/"{metadata["lastUpdated"]}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
     logger.debug(f"Returning metadata: thinking events={len(metadata['thinking'])}, has_stats={metadata['session_stats'] is not None}")
-    return metadata
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    body = orjson.dumps(metadata)
+    # Compressed here rather than by middleware so the /chat stream is never buffered
+    if len(body) >= METADATA_GZIP_MIN_SIZE and "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @app.get("/health")
-async def health():
+async def health(request: Request):
     """Health check endpoint."""
     return {
         "status": "healthy",
         "version": "2.0.0",
         "implementation": "direct-protocol",
-        "agent_connected": agent_client is not None
+        "agent_connected": request.app.state.agent_client is not None
     }
 
 
@@ -265,6 +355,9 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=settings.port,
         reload=True,
+        # uvloop is POSIX-only; Windows falls back to the default asyncio loop
+        loop="auto" if sys.platform == "win32" else "uvloop",
+        http="httptools",
         log_level="info"
     )
 
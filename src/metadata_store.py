@@ -3,47 +3,122 @@ Metadata Store for CUSTOM events (thinking, session_stats)
 Stores metadata separately so frontends can retrieve it without CopilotKit filtering.
 """
 import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import orjson
+
+from .config import get_settings
 
 logger = logging.getLogger(__name__)
 
-class MetadataStore:
-    """In-memory store for conversation metadata."""
+
+class MetadataBackend(ABC):
+    """Storage interface for conversation metadata."""
+    
+    @abstractmethod
+    async def init_thread(self, thread_id: str):
+        """Initialize storage for a new thread."""
+    
+    @abstractmethod
+    async def add_thinking(self, thread_id: str, thinking_event: Dict[str, Any]):
+        """Add a thinking event."""
     
-    def __init__(self, ttl_minutes: int = 60):
-        self._store: Dict[str, Dict[str, Any]] = {}
+    async def add_thinking_many(self, thread_id: str, thinking_events: List[Dict[str, Any]]):
+        """Add several thinking events (backends override this to batch the write)."""
+        for thinking_event in thinking_events:
+            await self.add_thinking(thread_id, thinking_event)
+    
+    @abstractmethod
+    async def set_session_stats(self, thread_id: str, stats: Dict[str, Any]):
+        """Set session statistics."""
+    
+    @abstractmethod
+    async def get_metadata(self, thread_id: str) -> Dict[str, Any]:
+        """Get all metadata for a thread."""
+    
+    async def cleanup_old_threads(self):
+        """Remove threads older than TTL (no-op for self-expiring backends)."""
+    
+    async def close(self):
+        """Release backend resources."""
+
+
+class InMemoryBackend(MetadataBackend):
+    """
+    In-memory store for conversation metadata (single process only).
+    
+    Threads are kept in least-recently-updated order, so expiry only ever
+    inspects the oldest entries and the store is capped at max_threads.
+    Each thread keeps at most max_thinking_events thinking events (oldest dropped).
+    """
+    
+    def __init__(self, ttl_minutes: int = 60, max_threads: int = 10000, max_thinking_events: int = 1000):
+        self._store: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
         self._ttl_minutes = ttl_minutes
-        
-    def init_thread(self, thread_id: str):
+        self._max_threads = max_threads
+        self._max_thinking_events = max_thinking_events
+    
+    async def init_thread(self, thread_id: str):
         """Initialize storage for a new thread."""
-        if thread_id not in self._store:
-            self._store[thread_id] = {
-                "thinking": [],
+        self._init_thread(thread_id, datetime.now())
+    
+    def _init_thread(self, thread_id: str, now: datetime) -> Dict[str, Any]:
+        """Get a thread's entry, creating it if needed."""
+        data = self._store.get(thread_id)
+        if data is None:
+            data = self._store[thread_id] = {
+                "thinking": deque(maxlen=self._max_thinking_events),
                 "session_stats": None,
-                "created_at": datetime.now(),
-                "last_updated": datetime.now()
+                "created_at": now,
+                "last_updated": now
             }
             logger.debug(f"[MetadataStore] Initialized thread: {thread_id}")
+            
+            if len(self._store) > self._max_threads:
+                evicted_id, _ = self._store.popitem(last=False)
+                logger.info(f"[MetadataStore] Evicted least recently updated thread: {evicted_id}")
+        return data
     
-    def add_thinking(self, thread_id: str, thinking_event: Dict[str, Any]):
-        """Add a thinking event."""
-        self.init_thread(thread_id)
-        self._store[thread_id]["thinking"].append({
-            **thinking_event,
-            "timestamp": datetime.now().isoformat()
-        })
-        self._store[thread_id]["last_updated"] = datetime.now()
-        logger.debug(f"[MetadataStore] Added thinking event to thread {thread_id}")
-    
-    def set_session_stats(self, thread_id: str, stats: Dict[str, Any]):
+    def _touch(self, thread_id: str, data: Dict[str, Any], now: datetime):
+        """Mark a thread as updated (moves it to the back of the expiry order)."""
+        data["last_updated"] = now
+        self._store.move_to_end(thread_id)
+    
+    async def add_thinking(self, thread_id: str, thinking_event: Dict[str, Any]):
+        """
+        Add a thinking event.
+        
+        The stored event is a shallow copy, so nested values are shared with
+        the caller's dict and must not be mutated after this call.
+        """
+        await self.add_thinking_many(thread_id, [thinking_event])
+    
+    async def add_thinking_many(self, thread_id: str, thinking_events: List[Dict[str, Any]]):
+        """Add several thinking events (stored as shallow copies, like add_thinking)."""
+        # One clock read per call, shared by the event timestamps and last_updated
+        now = datetime.now()
+        timestamp = now.isoformat()
+        data = self._init_thread(thread_id, now)
+        for thinking_event in thinking_events:
+            event = thinking_event.copy()
+            event["timestamp"] = timestamp
+            data["thinking"].append(event)
+        self._touch(thread_id, data, now)
+        logger.debug(f"[MetadataStore] Added {len(thinking_events)} thinking event(s) to thread {thread_id}")
+    
+    async def set_session_stats(self, thread_id: str, stats: Dict[str, Any]):
         """Set session statistics."""
-        self.init_thread(thread_id)
-        self._store[thread_id]["session_stats"] = stats
-        self._store[thread_id]["last_updated"] = datetime.now()
+        now = datetime.now()
+        data = self._init_thread(thread_id, now)
+        data["session_stats"] = stats
+        self._touch(thread_id, data, now)
         logger.debug(f"[MetadataStore] Set session stats for thread {thread_id}")
     
-    def get_metadata(self, thread_id: str) -> Dict[str, Any]:
+    async def get_metadata(self, thread_id: str) -> Dict[str, Any]:
         """Get all metadata for a thread."""
         if thread_id not in self._store:
             return {
@@ -54,22 +129,120 @@ class MetadataStore:
         
         data = self._store[thread_id]
         return {
-            "thinking": data["thinking"],
+            "thinking": list(data["thinking"]),
             "session_stats": data["session_stats"],
             "lastUpdated": data["last_updated"].isoformat() if data["last_updated"] else None
         }
     
-    def cleanup_old_threads(self):
+    async def cleanup_old_threads(self):
         """Remove threads older than TTL."""
         cutoff = datetime.now() - timedelta(minutes=self._ttl_minutes)
-        to_remove = [
-            tid for tid, data in self._store.items()
-            if data["last_updated"] < cutoff
-        ]
-        for tid in to_remove:
-            del self._store[tid]
+        # Oldest first: stop at the first thread that is still fresh
+        while self._store:
+            tid, data = next(iter(self._store.items()))
+            if data["last_updated"] >= cutoff:
+                break
+            self._store.popitem(last=False)
             logger.info(f"[MetadataStore] Cleaned up old thread: {tid}")
 
-# Global metadata store instance
-metadata_store = MetadataStore(ttl_minutes=60)
 
+class RedisBackend(MetadataBackend):
+    """
+    Redis store shared by every worker process.
+    
+    Each thread uses three keys, all expiring after the TTL:
+    meta:{thread_id}:thinking (list of the latest max_thinking_events JSON
+    events), meta:{thread_id}:stats (JSON) and meta:{thread_id}:updated
+    (ISO timestamp).
+    """
+    
+    def __init__(self, url: str, ttl_minutes: int = 60, max_thinking_events: int = 1000):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "The redis metadata backend requires the 'redis' package. "
+                "Install it with: pip install -e '.[redis]'"
+            ) from e
+        
+        self._redis = redis.from_url(url)
+        self._ttl_seconds = ttl_minutes * 60
+        self._max_thinking_events = max_thinking_events
+    
+    @staticmethod
+    def _keys(thread_id: str):
+        prefix = f"meta:{thread_id}"
+        return f"{prefix}:thinking", f"{prefix}:stats", f"{prefix}:updated"
+    
+    async def init_thread(self, thread_id: str):
+        """Initialize storage for a new thread (keys are created on first write)."""
+    
+    async def add_thinking(self, thread_id: str, thinking_event: Dict[str, Any]):
+        """Add a thinking event."""
+        await self.add_thinking_many(thread_id, [thinking_event])
+    
+    async def add_thinking_many(self, thread_id: str, thinking_events: List[Dict[str, Any]]):
+        """Add several thinking events in one round trip."""
+        thinking_key, _, updated_key = self._keys(thread_id)
+        now = datetime.now().isoformat()
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.rpush(thinking_key, *(orjson.dumps({**event, "timestamp": now}) for event in thinking_events))
+            pipe.ltrim(thinking_key, -self._max_thinking_events, -1)
+            pipe.expire(thinking_key, self._ttl_seconds)
+            pipe.set(updated_key, now, ex=self._ttl_seconds)
+            await pipe.execute()
+        logger.debug(f"[MetadataStore] Added {len(thinking_events)} thinking event(s) to thread {thread_id}")
+    
+    async def set_session_stats(self, thread_id: str, stats: Dict[str, Any]):
+        """Set session statistics."""
+        thinking_key, stats_key, updated_key = self._keys(thread_id)
+        now = datetime.now().isoformat()
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.set(stats_key, orjson.dumps(stats), ex=self._ttl_seconds)
+            # Keep the thinking list alive as long as the rest of the thread
+            pipe.expire(thinking_key, self._ttl_seconds)
+            pipe.set(updated_key, now, ex=self._ttl_seconds)
+            await pipe.execute()
+        logger.debug(f"[MetadataStore] Set session stats for thread {thread_id}")
+    
+    async def get_metadata(self, thread_id: str) -> Dict[str, Any]:
+        """Get all metadata for a thread."""
+        thinking_key, stats_key, updated_key = self._keys(thread_id)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.lrange(thinking_key, 0, -1)
+            pipe.get(stats_key)
+            pipe.get(updated_key)
+            thinking, stats, last_updated = await pipe.execute()
+        
+        return {
+            "thinking": [orjson.loads(item) for item in thinking],
+            "session_stats": orjson.loads(stats) if stats else None,
+            "lastUpdated": last_updated.decode() if last_updated else None
+        }
+    
+    async def close(self):
+        """Close the Redis connection pool."""
+        await self._redis.aclose()
+
+
+def _redact_url(url: str) -> str:
+    """Return a connection URL without its credentials, for logging."""
+    parts = urlsplit(url)
+    return parts._replace(netloc=parts.netloc.rpartition("@")[2], query="").geturl()
+
+
+def create_metadata_store() -> MetadataBackend:
+    """Create the metadata backend selected by settings.metadata_backend."""
+    settings = get_settings()
+    backend = settings.metadata_backend.lower()
+    
+    if backend == "redis":
+        logger.info(f"[MetadataStore] Using Redis backend at {_redact_url(settings.redis_url)}")
+        return RedisBackend(settings.redis_url, ttl_minutes=settings.metadata_ttl_minutes)
+    if backend == "memory":
+        return InMemoryBackend(ttl_minutes=settings.metadata_ttl_minutes)
+    raise ValueError(f"Unknown metadata backend: {settings.metadata_backend!r} (expected 'memory' or 'redis')")
+
+
+# Global metadata store instance
+metadata_store = create_metadata_store()
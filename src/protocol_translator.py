@@ -2,18 +2,93 @@
 AG-UI Protocol Translator
 Translates Google Agent Engine events to AG-UI Protocol events.
 """
-import json
+import asyncio
 import logging
-import uuid
+import secrets
 import time
-from typing import AsyncIterator, Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, List, Optional
+
+import orjson
 
 logger = logging.getLogger(__name__)
 
+# Frames are written out once this much output is pending (and always before
+# waiting on the next Agent Engine event)
+DEFAULT_MAX_BATCH_SIZE = 16 * 1024
+
+# Yield to the event loop after this many Agent Engine events, so a client
+# disconnect is noticed even when upstream events arrive already buffered
+CANCELLATION_CHECK_INTERVAL = 100
+
+# Most thinking events handed to the metadata store in one write
+METADATA_WRITE_BATCH_SIZE = 100
+
+# How long a stream that ends early (e.g. client disconnect) waits for queued
+# thinking events to be written before dropping them
+METADATA_DRAIN_TIMEOUT_SECONDS = 1.0
+
+# Fixed-shape SSE frames; each %b takes a JSON-encoded string (orjson.dumps)
+RUN_STARTED_SSE = b'data: {"type":"RUN_STARTED","threadId":%b,"runId":%b}\n\n'
+RUN_FINISHED_SSE = b'data: {"type":"RUN_FINISHED","threadId":%b,"runId":%b}\n\n'
+TEXT_MESSAGE_START_SSE = b'data: {"type":"TEXT_MESSAGE_START","messageId":%b,"role":"assistant"}\n\n'
+TEXT_MESSAGE_END_SSE = b'data: {"type":"TEXT_MESSAGE_END","messageId":%b}\n\n'
+TOOL_CALL_END_SSE = b'data: {"type":"TOOL_CALL_END","toolCallId":%b}\n\n'
+TOOL_CALL_RESULT_SSE = b'data: {"type":"TOOL_CALL_RESULT","messageId":%b,"toolCallId":%b,"content":%b,"role":"tool"}\n\n'
+RUN_ERROR_SSE = b'data: {"type":"RUN_ERROR","message":%b,"code":"TRANSLATION_ERROR"}\n\n'
+
+# RUN_ERROR messages are truncated to this many characters
+MAX_ERROR_MESSAGE_LENGTH = 512
+
+# TOOL_CALL_RESULT content for thinking steps, and the same already encoded as a JSON string
+THINKING_COMPLETE_JSON = '{"status":"complete"}'
+THINKING_COMPLETE_CONTENT = orjson.dumps(THINKING_COMPLETE_JSON)
+
+# TOOL_CALL_ARGS delta for thinking steps: four token counts (ints) and the JSON-encoded model name
+THINKING_ARGS_TEMPLATE = (
+    '{"status":"in_progress","thoughtsTokenCount":%d,"totalTokenCount":%d,'
+    '"candidatesTokenCount":%d,"promptTokenCount":%d,"model":%s}'
+)
+
+# All four frames of a thinking step (TOOL_CALL_START/ARGS/END/RESULT) in one template.
+# Placeholders: toolCallId x3, the ARGS delta (JSON string), result messageId, toolCallId
+THINKING_STEP_SSE = (
+    b'data: {"type":"TOOL_CALL_START","toolCallId":%b,"toolCallName":"thinking_step"}\n\n'
+    b'data: {"type":"TOOL_CALL_ARGS","toolCallId":%b,"delta":%b}\n\n'
+    b'data: {"type":"TOOL_CALL_END","toolCallId":%b}\n\n'
+    b'data: {"type":"TOOL_CALL_RESULT","messageId":%b,"toolCallId":%b,"content":'
+    + THINKING_COMPLETE_CONTENT + b',"role":"tool"}\n\n'
+)
+
+# usage_metadata token counts reported for thinking steps, in THINKING_ARGS_TEMPLATE order
+USAGE_TOKEN_KEYS = ("thoughts_token_count", "total_token_count", "candidates_token_count", "prompt_token_count")
+
+# Shared read-only default for events without usage_metadata
+_EMPTY_USAGE: Dict[str, Any] = {}
+
 class AGUIProtocolTranslator:
     """Translates Agent Engine events to AG-UI Protocol SSE events."""
     
-    def __init__(self, metadata_store=None):
+    # One translator is created per /chat request; slots skip the per-instance __dict__
+    __slots__ = (
+        "thread_id",
+        "run_id",
+        "current_message_id",
+        "metadata_store",
+        "total_thinking_tokens",
+        "total_tool_calls",
+        "session_start_time",
+        "message_started",
+        "current_text_message_id",
+        "max_batch_size",
+        "_batch",
+        "_id_prefix",
+        "_id_counter",
+        "_metadata_queue",
+        "_metadata_writer",
+        "_metadata_pending",
+    )
+    
+    def __init__(self, metadata_store=None, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE):
         self.thread_id: Optional[str] = None
         self.run_id: Optional[str] = None
         self.current_message_id: Optional[str] = None
@@ -28,12 +103,25 @@ class AGUIProtocolTranslator:
         self.message_started = False
         self.current_text_message_id: Optional[str] = None
         
+        # SSE frames waiting to be yielded as a single chunk
+        self.max_batch_size = max_batch_size
+        self._batch = bytearray()
+        
+        # Generated ids are a random per-stream prefix plus a counter
+        self._id_prefix = secrets.token_hex(8)
+        self._id_counter = 0
+        
+        # Thinking steps are written to the metadata store by a background task
+        self._metadata_queue: Optional[asyncio.Queue] = None
+        self._metadata_writer: Optional[asyncio.Task] = None
+        self._metadata_pending = 0  # queued or being written
+        
     async def translate_stream(
         self,
         agent_engine_events: AsyncIterator[Dict[str, Any]],
         thread_id: str,
         run_id: str
-    ) -> AsyncIterator[str]:
+    ) -> AsyncIterator[bytes]:
         """
         Translate Agent Engine events to AG-UI Protocol SSE events.
         
@@ -43,29 +131,40 @@ class AGUIProtocolTranslator:
             run_id: Run ID for this execution
             
         Yields:
-            SSE-formatted AG-UI Protocol events (as strings)
+            SSE-formatted AG-UI Protocol events (as UTF-8 bytes). Frames produced
+            from the same Agent Engine event are joined into one chunk.
         """
         self.thread_id = thread_id
         self.run_id = run_id
-        self.session_start_time = time.time()
+        # JSON-encoded once for the RUN_STARTED/RUN_FINISHED templates
+        thread_id_json = orjson.dumps(thread_id)
+        run_id_json = orjson.dumps(run_id)
+        self.session_start_time = time.monotonic()
         
         try:
             # Emit RUN_STARTED
-            yield self._format_sse({
-                "type": "RUN_STARTED",
-                "threadId": thread_id,
-                "runId": run_id
-            })
+            yield RUN_STARTED_SSE % (thread_id_json, run_id_json)
             
+            event_count = 0
             async for event in agent_engine_events:
-                logger.debug(f"Translating Agent Engine event: {event.get('id', 'unknown')}")
+                logger.debug("Translating Agent Engine event: %s", event.get('id', 'unknown'))
+                
+                event_count += 1
+                if event_count % CANCELLATION_CHECK_INTERVAL == 0:
+                    await asyncio.sleep(0)
                 
                 # Translate each event to AG-UI Protocol
-                async for agui_event in self._translate_event(event):
-                    yield agui_event
+                for agui_event in self._translate_event(event):
+                    chunk = self._buffer(agui_event)
+                    if chunk:
+                        yield chunk
+                
+                # Flush before waiting on the next Agent Engine event
+                if self._batch:
+                    yield self._flush()
             
             # Calculate session duration
-            duration_seconds = time.time() - self.session_start_time if self.session_start_time else 0
+            duration_seconds = time.monotonic() - self.session_start_time if self.session_start_time else 0
             
             # Send session statistics as ACTIVITY_SNAPSHOT (AG-UI Protocol native)
             session_stats_content = {
@@ -78,102 +177,116 @@ class AGUIProtocolTranslator:
             
             session_stats_message_id = f"session-stats-{thread_id}-{run_id}"
             
-            yield self._format_sse({
+            chunk = self._buffer(self._format_sse({
                 "type": "ACTIVITY_SNAPSHOT",
                 "messageId": session_stats_message_id,
                 "activityType": "SESSION_STATS",
                 "content": session_stats_content,
                 "replace": True
-            })
-            
-            logger.debug(f"📤 Sent ACTIVITY_SNAPSHOT for session stats (messageId: {session_stats_message_id})")
-            
-            # Store in metadata store if available
-            if self.metadata_store and self.thread_id:
-                self.metadata_store.set_session_stats(self.thread_id, session_stats_content)
+            }))
+            if chunk:
+                yield chunk
             
+            logger.debug("📤 Sent ACTIVITY_SNAPSHOT for session stats (messageId: %s)", session_stats_message_id)
             logger.info(f"📊 Session stats - Thinking tokens: {self.total_thinking_tokens}, Tool calls: {self.total_tool_calls}, Duration: {duration_seconds:.2f}s")
             
             # Close any open text message before finishing the stream
             if self.message_started and self.current_text_message_id:
-                yield self._format_sse({
-                    "type": "TEXT_MESSAGE_END",
-                    "messageId": self.current_text_message_id
-                })
-                logger.debug(f"📤 TEXT_MESSAGE_END (stream complete)")
+                chunk = self._buffer(TEXT_MESSAGE_END_SSE % orjson.dumps(self.current_text_message_id))
+                if chunk:
+                    yield chunk
+                logger.debug("📤 TEXT_MESSAGE_END (stream complete)")
                 self.message_started = False
                 self.current_text_message_id = None
-                    
+            
+            if self._batch:
+                yield self._flush()
+            
+            # Store in metadata store if available; RUN_FINISHED waits for all
+            # metadata writes so /metadata is complete once the run has finished
+            if self.metadata_store and self.thread_id:
+                await self._drain_metadata_writes()
+                try:
+                    await self.metadata_store.set_session_stats(self.thread_id, session_stats_content)
+                except Exception as e:
+                    # The run itself was delivered; like thinking writes, a store failure is only logged
+                    logger.exception("Failed to store session stats: %s", e)
+            
             # Emit RUN_FINISHED
-            yield self._format_sse({
-                "type": "RUN_FINISHED",
-                "threadId": thread_id,
-                "runId": run_id
-            })
+            yield RUN_FINISHED_SSE % (thread_id_json, run_id_json)
             
         except Exception as e:
-            logger.error(f"Error in translation stream: {e}", exc_info=True)
-            # Emit RUN_ERROR
-            yield self._format_sse({
-                "type": "RUN_ERROR",
-                "message": str(e),
-                "code": "TRANSLATION_ERROR"
-            })
+            logger.exception("Error in translation stream: %s", e)
+            # Emit RUN_ERROR after any frames already translated
+            chunk = self._buffer(RUN_ERROR_SSE % orjson.dumps(str(e)[:MAX_ERROR_MESSAGE_LENGTH]))
+            if chunk:
+                yield chunk
+            if self._batch:
+                yield self._flush()
+            await self._drain_metadata_writes()
+        
+        finally:
+            # Stop the upstream Agent Engine request too when the client goes away
+            # (GeneratorExit/CancelledError) or translation stops early
+            aclose = getattr(agent_engine_events, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            await self._stop_metadata_writer()
     
-    async def _translate_event(self, event: Dict[str, Any]) -> AsyncIterator[str]:
-        """Translate a single Agent Engine event to AG-UI Protocol events."""
+    def _translate_event(self, event: Dict[str, Any]) -> List[bytes]:
+        """Translate a single Agent Engine event to AG-UI Protocol SSE frames."""
         
         content = event.get("content", {})
         parts = content.get("parts", [])
         
         if not parts:
             logger.debug("No parts in event, skipping")
-            return
+            return []
         
-        # Process each part
+        frames: List[bytes] = []
+        
+        # Process each part: text messages, function calls (tool calls) and
+        # function responses (tool results); other fields such as
+        # thought_signature have no handler and are skipped
         for part in parts:
-            # Handle text messages
-            if "text" in part:
-                async for agui_event in self._handle_text_message(part, event):
-                    yield agui_event
-            
-            # Handle function calls (tool calls)
-            elif "function_call" in part:
-                async for agui_event in self._handle_function_call(part):
-                    yield agui_event
-            
-            # Handle function responses (tool results)
-            elif "function_response" in part:
-                async for agui_event in self._handle_function_response(part):
-                    yield agui_event
+            for key in part:
+                handler = _PART_HANDLERS.get(key)
+                if handler is not None:
+                    frames.extend(handler(self, part, event))
+                    break
+        
+        return frames
     
-    async def _handle_text_message(
+    def _handle_text_message(
         self, 
         part: Dict[str, Any],
         event: Dict[str, Any]
-    ) -> AsyncIterator[str]:
+    ) -> List[bytes]:
         """Handle text message parts."""
         
-        text = part.get("text", "")
-        has_thinking = "thought_signature" in part
-        
+        # Empty deltas are common between tool turns; drop them before any other work
+        # (whitespace-only deltas are kept, they carry the message's formatting)
+        text = part["text"]
         if not text:
-            return
+            return []
+        
+        has_thinking = "thought_signature" in part
+        frames: List[bytes] = []
         
         # Close any open text message before handling thinking (tool call)
         if has_thinking and self.message_started:
-            yield self._format_sse({
-                "type": "TEXT_MESSAGE_END",
-                "messageId": self.current_text_message_id
-            })
-            logger.debug(f"📤 TEXT_MESSAGE_END (before thinking)")
+            frames.append(TEXT_MESSAGE_END_SSE % orjson.dumps(self.current_text_message_id))
+            logger.debug("📤 TEXT_MESSAGE_END (before thinking)")
             self.message_started = False
             self.current_text_message_id = None
         
         # If thinking is present, send as TOOL_CALL (so frontend can render without causing loop)
         if has_thinking:
-            usage = event.get('usage_metadata', {})
-            thoughts_token_count = usage.get('thoughts_token_count', 0)
+            usage = event.get('usage_metadata') or _EMPTY_USAGE
+            thoughts_token_count, total_token_count, candidates_token_count, prompt_token_count = (
+                usage.get(key, 0) for key in USAGE_TOKEN_KEYS
+            )
+            model = event.get('model_version', 'unknown')
             
             # Track total thinking tokens
             self.total_thinking_tokens += thoughts_token_count
@@ -181,95 +294,85 @@ class AGUIProtocolTranslator:
             logger.info(f"🧠 Thinking detected (thoughts_token_count: {thoughts_token_count})")
             
             # Create unique tool call ID for this thinking event
-            thinking_tool_id = f"thinking-{self.thread_id}-{int(time.time() * 1000)}"
+            thinking_tool_id = f"thinking-{self.thread_id}-{self._new_id()}"
+            thinking_tool_id_json = orjson.dumps(thinking_tool_id)
             
             # Thinking data as tool arguments
             thinking_args = {
                 "status": "in_progress",
                 "thoughtsTokenCount": thoughts_token_count,
-                "totalTokenCount": usage.get('total_token_count', 0),
-                "candidatesTokenCount": usage.get('candidates_token_count', 0),
-                "promptTokenCount": usage.get('prompt_token_count', 0),
-                "model": event.get('model_version', 'unknown')
+                "totalTokenCount": total_token_count,
+                "candidatesTokenCount": candidates_token_count,
+                "promptTokenCount": prompt_token_count,
+                "model": model
             }
             
-            # Emit TOOL_CALL_START
-            yield self._format_sse({
-                "type": "TOOL_CALL_START",
-                "toolCallId": thinking_tool_id,
-                "toolCallName": "thinking_step"
-            })
-            
-            # Emit TOOL_CALL_ARGS
-            yield self._format_sse({
-                "type": "TOOL_CALL_ARGS",
-                "toolCallId": thinking_tool_id,
-                "delta": json.dumps(thinking_args)
-            })
+            thinking_args_json = THINKING_ARGS_TEMPLATE % (
+                thoughts_token_count,
+                total_token_count,
+                candidates_token_count,
+                prompt_token_count,
+                orjson.dumps(model).decode()
+            )
             
-            # Emit TOOL_CALL_END
-            yield self._format_sse({
-                "type": "TOOL_CALL_END",
-                "toolCallId": thinking_tool_id
-            })
+            # Emit TOOL_CALL_START, TOOL_CALL_ARGS, TOOL_CALL_END and TOOL_CALL_RESULT
+            # (the result marks it as complete, which prevents an agent loop)
+            frames.append(THINKING_STEP_SSE % (
+                thinking_tool_id_json,
+                thinking_tool_id_json,
+                orjson.dumps(thinking_args_json),
+                thinking_tool_id_json,
+                orjson.dumps(f"result-{thinking_tool_id}"),
+                thinking_tool_id_json
+            ))
             
-            # Emit TOOL_CALL_RESULT (marks it as complete, prevents agent loop)
-            yield self._format_sse({
-                "type": "TOOL_CALL_RESULT",
-                "messageId": f"result-{thinking_tool_id}",
-                "toolCallId": thinking_tool_id,
-                "content": json.dumps({"status": "complete"}),
-                "role": "tool"
-            })
+            logger.debug("📤 Sent thinking as TOOL_CALL (toolCallId: %s)", thinking_tool_id)
             
-            logger.debug(f"📤 Sent thinking as TOOL_CALL (toolCallId: {thinking_tool_id})")
-            
-            # Store in metadata store if available
+            # Store in metadata store if available (written in the background)
             if self.metadata_store and self.thread_id:
-                self.metadata_store.add_thinking(self.thread_id, thinking_args)
+                self._queue_thinking(thinking_args)
         
         # Start a new text message if not already started
+        start_frame = b""
         if not self.message_started:
-            self.current_text_message_id = str(uuid.uuid4())
+            self.current_text_message_id = self._new_id()
             self.message_started = True
             
             # Emit TEXT_MESSAGE_START (only once per message)
-            yield self._format_sse({
-                "type": "TEXT_MESSAGE_START",
-                "messageId": self.current_text_message_id,
-                "role": "assistant"
-            })
-            logger.debug(f"📤 TEXT_MESSAGE_START (messageId: {self.current_text_message_id})")
-        
-        # Emit TEXT_MESSAGE_CONTENT for this chunk (streaming delta)
-        yield self._format_sse({
+            start_frame = TEXT_MESSAGE_START_SSE % orjson.dumps(self.current_text_message_id)
+            logger.debug("📤 TEXT_MESSAGE_START (messageId: %s)", self.current_text_message_id)
+        
+        # Emit TEXT_MESSAGE_CONTENT for this chunk (streaming delta); a new message's
+        # START goes out in the same frame so a batch flush never splits the pair
+        frames.append(start_frame + self._format_sse({
             "type": "TEXT_MESSAGE_CONTENT",
             "messageId": self.current_text_message_id,
             "delta": text
-        })
-        logger.debug(f"📤 TEXT_MESSAGE_CONTENT chunk ({len(text)} chars)")
+        }))
+        logger.debug("📤 TEXT_MESSAGE_CONTENT chunk (%d chars)", len(text))
         
         # Don't send TEXT_MESSAGE_END here - keep message open for streaming!
         
         # Send thinking completion as a separate tool call (optional - can be removed if not needed)
         # The initial thinking tool call already has a TOOL_CALL_RESULT marking it complete
         # This is just for tracking in metadata if needed
+        
+        return frames
     
-    async def _handle_function_call(self, part: Dict[str, Any]) -> AsyncIterator[str]:
+    def _handle_function_call(self, part: Dict[str, Any], event: Dict[str, Any]) -> List[bytes]:
         """Handle function call (tool call) parts."""
         
+        frames: List[bytes] = []
+        
         # Close any open text message before starting a tool call
         if self.message_started:
-            yield self._format_sse({
-                "type": "TEXT_MESSAGE_END",
-                "messageId": self.current_text_message_id
-            })
-            logger.debug(f"📤 TEXT_MESSAGE_END (before tool call)")
+            frames.append(TEXT_MESSAGE_END_SSE % orjson.dumps(self.current_text_message_id))
+            logger.debug("📤 TEXT_MESSAGE_END (before tool call)")
             self.message_started = False
             self.current_text_message_id = None
         
         function_call = part.get("function_call", {})
-        tool_call_id = function_call.get("id", str(uuid.uuid4()))
+        tool_call_id = function_call.get("id") or self._new_id()
         tool_name = function_call.get("name", "unknown")
         tool_args = function_call.get("args", {})
         
@@ -279,49 +382,122 @@ class AGUIProtocolTranslator:
         logger.info(f"🔧 Tool Call: {tool_name} (ID: {tool_call_id})")
         
         # Emit TOOL_CALL_START
-        yield self._format_sse({
+        frames.append(self._format_sse({
             "type": "TOOL_CALL_START",
             "toolCallId": tool_call_id,
             "toolCallName": tool_name
-        })
+        }))
         
         # Emit TOOL_CALL_ARGS (stream the full args as JSON)
-        args_json = json.dumps(tool_args)
-        yield self._format_sse({
+        args_json = orjson.dumps(tool_args).decode()
+        frames.append(self._format_sse({
             "type": "TOOL_CALL_ARGS",
             "toolCallId": tool_call_id,
             "delta": args_json
-        })
+        }))
         
         # Emit TOOL_CALL_END
-        yield self._format_sse({
-            "type": "TOOL_CALL_END",
-            "toolCallId": tool_call_id
-        })
+        frames.append(TOOL_CALL_END_SSE % orjson.dumps(tool_call_id))
+        
+        return frames
     
-    async def _handle_function_response(self, part: Dict[str, Any]) -> AsyncIterator[str]:
+    def _handle_function_response(self, part: Dict[str, Any], event: Dict[str, Any]) -> List[bytes]:
         """Handle function response (tool result) parts."""
         
         function_response = part.get("function_response", {})
-        tool_call_id = function_response.get("id", str(uuid.uuid4()))
+        tool_call_id = function_response.get("id") or self._new_id()
         tool_name = function_response.get("name", "unknown")
         response = function_response.get("response", {})
         
         logger.info(f"✅ Tool Result: {tool_name} (ID: {tool_call_id})")
         
         # Generate message ID for the tool result
-        message_id = str(uuid.uuid4())
+        message_id = self._new_id()
         
-        # Emit TOOL_CALL_RESULT
-        yield self._format_sse({
-            "type": "TOOL_CALL_RESULT",
-            "messageId": message_id,
-            "toolCallId": tool_call_id,
-            "content": json.dumps(response),
-            "role": "tool"
-        })
+        # Tool results that are already serialized are passed through as-is;
+        # anything else is sent as its JSON encoding
+        if isinstance(response, str):
+            content = response
+        else:
+            content = orjson.dumps(response).decode()
+        
+        # Emit TOOL_CALL_RESULT (content embedded as a JSON string)
+        return [TOOL_CALL_RESULT_SSE % (
+            orjson.dumps(message_id),
+            orjson.dumps(tool_call_id),
+            orjson.dumps(content)
+        )]
+    
+    def _new_id(self) -> str:
+        """Return an id unique to this stream (one random draw per stream, not per id)."""
+        self._id_counter += 1
+        return f"{self._id_prefix}-{self._id_counter}"
+    
+    def _queue_thinking(self, thinking_args: Dict[str, Any]):
+        """Hand a thinking step to the background metadata writer, starting it if needed."""
+        if self._metadata_writer is None:
+            self._metadata_queue = asyncio.Queue()
+            self._metadata_writer = asyncio.create_task(self._write_metadata())
+        self._metadata_queue.put_nowait(thinking_args)
+        self._metadata_pending += 1
+    
+    async def _write_metadata(self):
+        """Write queued thinking steps, batching whatever piled up during the previous write."""
+        queue = self._metadata_queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < METADATA_WRITE_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self.metadata_store.add_thinking_many(self.thread_id, batch)
+            except Exception as e:
+                logger.exception("Failed to store thinking events: %s", e)
+            finally:
+                self._metadata_pending -= len(batch)
+                for _ in batch:
+                    queue.task_done()
     
-    def _format_sse(self, event: Dict[str, Any]) -> str:
+    async def _drain_metadata_writes(self):
+        """Wait until every queued thinking step has been written."""
+        if self._metadata_writer is not None:
+            await self._metadata_queue.join()
+    
+    async def _stop_metadata_writer(self):
+        """Give queued thinking steps a short time to be written, then stop the writer."""
+        if self._metadata_writer is None:
+            return
+        try:
+            await asyncio.wait_for(self._metadata_queue.join(), METADATA_DRAIN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Dropping %d unwritten thinking events for thread %s",
+                self._metadata_pending, self.thread_id,
+            )
+        finally:
+            self._metadata_writer.cancel()
+            self._metadata_writer = None
+    
+    def _buffer(self, frame: bytes) -> Optional[bytes]:
+        """Append a frame to the batch; return the batch once it reaches max_batch_size."""
+        self._batch += frame
+        if len(self._batch) >= self.max_batch_size:
+            return self._flush()
+        return None
+    
+    def _flush(self) -> bytes:
+        """Return the pending frames and reset the batch buffer for reuse."""
+        chunk = bytes(self._batch)
+        self._batch.clear()
+        return chunk
+    
+    def _format_sse(self, event: Dict[str, Any]) -> bytes:
         """Format an event as SSE (Server-Sent Events)."""
-        return f"data: {json.dumps(event)}\n\n"
+        return b"data: " + orjson.dumps(event) + b"\n\n"
+
 
+# Translator method for the first recognized field of an Agent Engine part
+_PART_HANDLERS = {
+    "text": AGUIProtocolTranslator._handle_text_message,
+    "function_call": AGUIProtocolTranslator._handle_function_call,
+    "function_response": AGUIProtocolTranslator._handle_function_response,
+}
@@ -0,0 +1,62 @@
+"""Tests for the AG-UI protocol translator's SSE output."""
+import asyncio
+
+import orjson
+import pytest
+
+from src.protocol_translator import AGUIProtocolTranslator, DEFAULT_MAX_BATCH_SIZE
+
+
+async def _agent_engine_events(fail: bool = False):
+    yield {"content": {"parts": [{"text": "Hello"}]}}
+    yield {"content": {"parts": [{"function_call": {"id": "call-1", "name": "search", "args": {"q": "x"}}}]}}
+    yield {"content": {"parts": [{"function_response": {"id": "call-1", "name": "search", "response": {"ok": True}}}]}}
+    yield {"content": {"parts": [{"text": "Done"}]}}
+    if fail:
+        raise RuntimeError("upstream failed")
+
+
+def _translate(max_batch_size: int, fail: bool = False):
+    """Run the translator and return its raw chunks and the decoded event types."""
+    async def collect():
+        translator = AGUIProtocolTranslator(max_batch_size=max_batch_size)
+        return [
+            chunk
+            async for chunk in translator.translate_stream(_agent_engine_events(fail), "thread-1", "run-1")
+        ]
+
+    chunks = asyncio.run(collect())
+    frames = b"".join(chunks).split(b"\n\n")
+    types = [orjson.loads(frame[len(b"data: "):])["type"] for frame in frames if frame]
+    return chunks, types
+
+
+@pytest.mark.parametrize("max_batch_size", [1, 64, DEFAULT_MAX_BATCH_SIZE])
+def test_every_frame_is_delivered_for_any_batch_size(max_batch_size):
+    chunks, types = _translate(max_batch_size)
+
+    assert all(chunks)
+    assert types == [
+        "RUN_STARTED",
+        "TEXT_MESSAGE_START",
+        "TEXT_MESSAGE_CONTENT",
+        "TEXT_MESSAGE_END",
+        "TOOL_CALL_START",
+        "TOOL_CALL_ARGS",
+        "TOOL_CALL_END",
+        "TOOL_CALL_RESULT",
+        "TEXT_MESSAGE_START",
+        "TEXT_MESSAGE_CONTENT",
+        "ACTIVITY_SNAPSHOT",
+        "TEXT_MESSAGE_END",
+        "RUN_FINISHED",
+    ]
+
+
+@pytest.mark.parametrize("max_batch_size", [1, 64, DEFAULT_MAX_BATCH_SIZE])
+def test_run_error_is_delivered_for_any_batch_size(max_batch_size):
+    chunks, types = _translate(max_batch_size, fail=True)
+
+    assert all(chunks)
+    assert types[-2:] == ["TEXT_MESSAGE_CONTENT", "RUN_ERROR"]
+    assert "RUN_FINISHED" not in types